@@ -4,6 +4,7 @@ import shlex
 
 from aioconsole import ainput
 
+from joycontrol.controller import Controller
 from joycontrol.controller_state import button_push, ControllerState
 from joycontrol.transport import NotConnectedError
 
@@ -41,12 +42,36 @@ def _print_doc(string):
 class CLI:
     def __init__(self):
         self.commands = {}
+        # built-in cmd_ methods, resolved once instead of a getattr per entered command
+        self._builtin_commands = {name[4:]: fun for name, fun in inspect.getmembers(self)
+                                  if name.startswith('cmd_')}
 
     def add_command(self, name, command):
         if name in self.commands:
             raise ValueError(f'Command {name} already registered.')
         self.commands[name] = command
 
+    def add_commands(self, commands, **kwargs):
+        """
+        Registers multiple commands at once.
+        :param commands: dict mapping command names to commands
+        :param kwargs: passed to add_command for every command
+        """
+        for name, command in commands.items():
+            self.add_command(name, command, **kwargs)
+
+    def get_command_names(self):
+        """
+        :returns: tuple of all built-in and registered command names, e.g. for tab completion
+        """
+        return tuple(self._builtin_commands) + tuple(self.commands)
+
+    def _get_command(self, cmd):
+        command = self._builtin_commands.get(cmd)
+        if command is None:
+            command = self.commands.get(cmd)
+        return command
+
     async def cmd_help(self):
         print('Commands:')
         for name, fun in inspect.getmembers(self):
@@ -72,16 +97,10 @@ class CLI:
                 if cmd == 'exit':
                     return
 
-                if hasattr(self, f'cmd_{cmd}'):
-                    try:
-                        result = await getattr(self, f'cmd_{cmd}')(*args)
-                        if result:
-                            print(result)
-                    except Exception as e:
-                        print(e)
-                elif cmd in self.commands:
+                command_fun = self._get_command(cmd)
+                if command_fun is not None:
                     try:
-                        result = await self.commands[cmd](*args)
+                        result = await command_fun(*args)
                         if result:
                             print(result)
                     except Exception as e:
@@ -101,6 +120,24 @@ class ControllerCLI(CLI):
     def __init__(self, controller_state: ControllerState):
         super().__init__()
         self.controller_state = controller_state
+        # the emulated controller type cannot change at runtime
+        self._controller = controller_state.get_controller()
+
+    def add_command(self, name, command, requires=None):
+        """
+        :param requires: Controller or tuple of Controllers the command is available for. The controller type is
+                         checked once here, commands for other controllers are replaced by an error message.
+        """
+        if requires is not None:
+            if isinstance(requires, Controller):
+                requires = (requires,)
+            if self._controller not in requires:
+                names = ', '.join(controller.name for controller in requires)
+
+                async def unavailable(*args):
+                    raise ValueError(f'Command "{name}" only works with {names}!')
+                command = unavailable
+        super().add_command(name, command)
 
     async def cmd_help(self):
         print('Button commands:')
@@ -165,6 +202,7 @@ class ControllerCLI(CLI):
                 continue
 
             buttons_to_push = []
+            available_buttons = self.controller_state.button_state.get_available_buttons()
 
             for command in user_input.split('&&'):
                 cmd, *args = shlex.split(command)
@@ -172,18 +210,10 @@ class ControllerCLI(CLI):
                 if cmd == 'exit':
                     return
 
-                available_buttons = self.controller_state.button_state.get_available_buttons()
-
-                if hasattr(self, f'cmd_{cmd}'):
-                    try:
-                        result = await getattr(self, f'cmd_{cmd}')(*args)
-                        if result:
-                            print(result)
-                    except Exception as e:
-                        print(e)
-                elif cmd in self.commands:
+                command_fun = self._get_command(cmd)
+                if command_fun is not None:
                     try:
-                        result = await self.commands[cmd](*args)
+                        result = await command_fun(*args)
                         if result:
                             print(result)
                     except Exception as e:
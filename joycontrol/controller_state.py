@@ -1,9 +1,13 @@
 import asyncio
+import functools
+import logging
 
 from joycontrol import utils
 from joycontrol.controller import Controller
 from joycontrol.memory import FlashMemory
 
+logger = logging.getLogger(__name__)
+
 
 class ControllerState:
     def __init__(self, protocol, controller: Controller, spi_flash: FlashMemory = None):
@@ -202,7 +206,7 @@ async def button_push(controller_state, *buttons, sec=0.1):
     await asyncio.sleep(sec)
 
     for button in buttons:
-        print(button)
+        logger.debug(f'releasing {button}')
         # release button
         button_state.set_button(button, pushed=False)
 
@@ -210,6 +214,56 @@ async def button_push(controller_state, *buttons, sec=0.1):
     await controller_state.send()
 
 
+async def button_sequence(controller_state, *buttons, sec=0.1):
+    """
+    Pushes the given buttons one after another.
+    Releasing a button and pushing the next one are sent in a single report, unless the same button is repeated.
+    """
+    if not buttons:
+        raise ValueError('No Buttons were given.')
+
+    button_state = controller_state.button_state
+
+    previous = None
+    for button in buttons:
+        if previous is not None:
+            # release previous button
+            button_state.set_button(previous, pushed=False)
+            if previous == button:
+                # the release must be send on its own to register the button twice
+                await controller_state.send()
+
+        # push button
+        button_state.set_button(button)
+
+        # send report
+        await controller_state.send()
+        await asyncio.sleep(sec)
+        previous = button
+
+    # release last button
+    button_state.set_button(previous, pushed=False)
+    await controller_state.send()
+
+
+async def button_push_sequence(controller_state, *buttons, interval=0.14, sec=0.1):
+    """
+    Pushes the given buttons one after another at a fixed cadence.
+    Pushes are scheduled against a single deadline, so the time spent sending reports does not add up.
+    :param interval: time between the start of two pushes, including the push duration sec
+    :param sec: duration of each push
+    """
+    if not buttons:
+        raise ValueError('No Buttons were given.')
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time()
+    for button in buttons:
+        await button_push(controller_state, button, sec=sec)
+        deadline += interval
+        await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+
 class _StickCalibration:
     def __init__(self, h_center, v_center, h_max_above_center, v_max_above_center, h_max_below_center, v_max_below_center):
         self.h_center = h_center
@@ -285,10 +339,7 @@ class StickState:
         """
         Sets stick to center position using the calibration data.
         """
-        if self._calibration is None:
-            raise ValueError('No calibration data available.')
-        self._h_stick = self._calibration.h_center
-        self._v_stick = self._calibration.v_center
+        self.set_position(self.get_positions()['center'])
 
     def is_center(self, radius=0):
         return self._calibration.h_center - radius <= self._h_stick <= self._calibration.h_center + radius and \
@@ -298,37 +349,46 @@ class StickState:
         """
         Sets stick to up position using the calibration data.
         """
-        if self._calibration is None:
-            raise ValueError('No calibration data available.')
-        self._h_stick = self._calibration.h_center
-        self._v_stick = self._calibration.v_center + self._calibration.v_max_above_center
+        self.set_position(self.get_positions()['up'])
 
     def set_down(self):
         """
         Sets stick to down position using the calibration data.
         """
-        if self._calibration is None:
-            raise ValueError('No calibration data available.')
-        self._h_stick = self._calibration.h_center
-        self._v_stick = self._calibration.v_center - self._calibration.v_max_below_center
+        self.set_position(self.get_positions()['down'])
 
     def set_left(self):
         """
         Sets stick to left position using the calibration data.
         """
-        if self._calibration is None:
-            raise ValueError('No calibration data available.')
-        self._h_stick = self._calibration.h_center - self._calibration.h_max_below_center
-        self._v_stick = self._calibration.v_center
+        self.set_position(self.get_positions()['left'])
 
     def set_right(self):
         """
         Sets stick to right position using the calibration data.
         """
-        if self._calibration is None:
-            raise ValueError('No calibration data available.')
-        self._h_stick = self._calibration.h_center + self._calibration.h_max_above_center
-        self._v_stick = self._calibration.v_center
+        self.set_position(self.get_positions()['right'])
+
+    def get_positions(self):
+        """
+        :returns dict mapping 'center', 'up', 'down', 'left' and 'right' to the (h, v) stick values
+                 of the respective position, using the calibration data.
+        """
+        cal = self.get_calibration()
+        return {
+            'center': (cal.h_center, cal.v_center),
+            'up': (cal.h_center, cal.v_center + cal.v_max_above_center),
+            'down': (cal.h_center, cal.v_center - cal.v_max_below_center),
+            'left': (cal.h_center - cal.h_max_below_center, cal.v_center),
+            'right': (cal.h_center + cal.h_max_above_center, cal.v_center)
+        }
+
+    def set_position(self, position):
+        """
+        Sets horizontal and vertical stick values at once, e.g. to a position returned by get_positions.
+        :param position: (h, v) tuple
+        """
+        self._h_stick, self._v_stick = position
 
     def set_calibration(self, calibration):
         self._calibration = calibration
@@ -346,8 +406,18 @@ class StickState:
         return StickState(h=stick_h, v=stick_v)
 
     def __bytes__(self):
-        byte_1 = 0xFF & self._h_stick
-        byte_2 = (self._h_stick >> 8) | ((0xF & self._v_stick) << 4)
-        byte_3 = self._v_stick >> 4
-        assert all(0 <= byte <= 0xFF for byte in (byte_1, byte_2, byte_3))
-        return bytes((byte_1, byte_2, byte_3))
+        return _pack_stick(self._h_stick, self._v_stick)
+
+
+@functools.lru_cache(maxsize=64)
+def _pack_stick(h, v):
+    """
+    Serializes stick values into the 3 byte input report format.
+    Cached, since sticks are usually only moved between a few positions (center, up, down, left, right)
+    while the state is serialized for every input report.
+    """
+    byte_1 = 0xFF & h
+    byte_2 = (h >> 8) | ((0xF & v) << 4)
+    byte_3 = v >> 4
+    assert all(0 <= byte <= 0xFF for byte in (byte_1, byte_2, byte_3))
+    return bytes((byte_1, byte_2, byte_3))
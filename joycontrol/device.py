@@ -13,16 +13,24 @@ HID_PATH = '/bluez/switch/hid'
 
 class HidDevice:
     def __init__(self, device_id=None):
-        bus = dbus.SystemBus()
+        self._device_id = device_id
+        self._bus = dbus.SystemBus()
+        self.refresh()
 
+    def refresh(self):
+        """
+        Resolves the Bluetooth adapter again with a single GetManagedObjects call.
+        Required if bluez was restarted, since the old adapter proxy is bound to the previous bluez instance.
+        """
         # Get Bluetooth adapter from dbus interface
-        manager = dbus.Interface(bus.get_object('org.bluez', '/'), 'org.freedesktop.DBus.ObjectManager')
+        manager = dbus.Interface(self._bus.get_object('org.bluez', '/'), 'org.freedesktop.DBus.ObjectManager')
         for path, ifaces in manager.GetManagedObjects().items():
             adapter_info = ifaces.get('org.bluez.Adapter1')
             if adapter_info is None:
                 continue
-            elif device_id is None or device_id == adapter_info['Address'] or path.endswith(str(device_id)):
-                obj = bus.get_object('org.bluez', path)
+            elif self._device_id is None or self._device_id == adapter_info['Address'] or \
+                    path.endswith(str(self._device_id)):
+                obj = self._bus.get_object('org.bluez', path)
                 self.adapter = dbus.Interface(obj, 'org.bluez.Adapter1')
                 self.address = adapter_info['Address']
                 self._adapter_name = path.split('/')[-1]
@@ -30,7 +38,14 @@ class HidDevice:
                 self.properties = dbus.Interface(self.adapter, 'org.freedesktop.DBus.Properties')
                 break
         else:
-            raise ValueError(f'Adapter {device_id} not found.')
+            raise ValueError(f'Adapter {self._device_id} not found.')
+
+    def bluez_available(self):
+        """
+        Asks the D-Bus daemon if bluez currently owns its bus name. Does not call into bluez.
+        :returns True if bluez is running
+        """
+        return bool(self._bus.name_has_owner('org.bluez'))
 
     def get_address(self) -> str:
         """
@@ -41,6 +56,12 @@ class HidDevice:
     def powered(self, boolean=True):
         self.properties.Set(self.adapter.dbus_interface, 'Powered', boolean)
 
+    def is_powered(self):
+        """
+        :returns True if the adapter is powered on
+        """
+        return bool(self.properties.Get(self.adapter.dbus_interface, 'Powered'))
+
     def discoverable(self, boolean=True):
         """
         Make adapter discoverable, starts advertising.
@@ -71,18 +92,30 @@ class HidDevice:
 
     @staticmethod
     def register_sdp_record(record_path):
+        with open(record_path) as record:
+            return HidDevice.register_sdp_record_bytes(record.read())
+
+    @staticmethod
+    def register_sdp_record_bytes(record):
+        """
+        Registers the given SDP record with bluez.
+        :param record: SDP record xml as bytes or string
+        :returns uuid of the registered profile
+        """
         _uuid = str(uuid.uuid4())
 
-        with open(record_path) as record:
-            opts = {
-                'ServiceRecord': record.read(),
-                'Role': 'server',
-                'Service': HID_UUID,
-                'RequireAuthentication': False,
-                'RequireAuthorization': False
-            }
-            bus = dbus.SystemBus()
-            manager = dbus.Interface(bus.get_object("org.bluez", "/org/bluez"), "org.bluez.ProfileManager1")
-            manager.RegisterProfile(HID_PATH, _uuid, opts)
+        if isinstance(record, bytes):
+            record = record.decode()
+
+        opts = {
+            'ServiceRecord': record,
+            'Role': 'server',
+            'Service': HID_UUID,
+            'RequireAuthentication': False,
+            'RequireAuthorization': False
+        }
+        bus = dbus.SystemBus()
+        manager = dbus.Interface(bus.get_object("org.bluez", "/org/bluez"), "org.bluez.ProfileManager1")
+        manager.RegisterProfile(HID_PATH, _uuid, opts)
 
         return _uuid
@@ -3,7 +3,7 @@ import logging
 import time
 from asyncio import BaseTransport, BaseProtocol
 from contextlib import suppress
-from typing import Optional, Union, Tuple, Text
+from typing import Optional, Tuple
 
 from joycontrol import utils
 from joycontrol.controller import Controller
@@ -16,6 +16,9 @@ from crc8 import crc8
 
 logger = logging.getLogger(__name__)
 
+# stick data of controllers without the respective stick
+_NO_STICK = bytes(3)
+
 
 def controller_protocol_factory(controller: Controller, spi_flash=None):
     if isinstance(spi_flash, bytes):
@@ -81,11 +84,11 @@ class ControllerProtocol(BaseProtocol):
         # set button and stick data of input report
         input_report.set_button_status(self._controller_state.button_state)
         if self._controller_state.l_stick_state is None:
-            l_stick = [0x00, 0x00, 0x00]
+            l_stick = _NO_STICK
         else:
             l_stick = self._controller_state.l_stick_state
         if self._controller_state.r_stick_state is None:
-            r_stick = [0x00, 0x00, 0x00]
+            r_stick = _NO_STICK
         else:
             r_stick = self._controller_state.r_stick_state
         input_report.set_stick_status(l_stick, r_stick)
@@ -215,7 +218,13 @@ class ControllerProtocol(BaseProtocol):
                 if reader.cancel():
                     await reader
 
-    async def report_received(self, data: Union[bytes, Text], addr: Tuple[str, int]) -> None:
+    async def report_received(self, data: memoryview, addr: Tuple[str, int]) -> None:
+        """
+        Called by the transport for every received output report.
+        :param data: memoryview into the read buffer of the transport. It is overwritten by the next read,
+                     copy it (e.g. bytes(data)) if it has to be kept after this call returns.
+        :param addr: address of the sender
+        """
         self._data_received.set()
 
         try:
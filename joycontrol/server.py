@@ -1,24 +1,106 @@
 import asyncio
+import errno
 import logging
+import os
 import socket
+import struct
+import time
+from importlib import resources
 
 import dbus
-import pkg_resources
 
-from joycontrol import utils
 from joycontrol.device import HidDevice
 from joycontrol.report import InputReport
 from joycontrol.transport import L2CAP_Transport
 
-PROFILE_PATH = pkg_resources.resource_filename('joycontrol', 'profile/sdp_record_hid.xml')
+_PROFILE = resources.files('joycontrol').joinpath('profile/sdp_record_hid.xml')
+PROFILE_PATH = str(_PROFILE)
+# SDP record is read once and reused for every server
+_SDP_RECORD = _PROFILE.read_bytes()
 logger = logging.getLogger(__name__)
 
+# Linux Bluetooth socket options, not exported by the socket module
+SOL_L2CAP = getattr(socket, 'SOL_L2CAP', 6)
+L2CAP_OPTIONS = getattr(socket, 'L2CAP_OPTIONS', 0x01)
+# struct l2cap_options: omtu, imtu, flush_to, mode, fcs, max_tx, txwin_size
+_L2CAP_OPTIONS_FORMAT = 'HHHBBBH'
+
+SOCKET_BUFFER_SIZE = 256 * 1024
+# highest priority allowed without CAP_NET_ADMIN, queues HID reports ahead of bulk traffic
+SOCKET_PRIORITY = 6
+# flush timeout in ms, stale reports are dropped instead of being retransmitted
+L2CAP_FLUSH_TIMEOUT = 20
+
+# set once the SDP record was registered with bluez by this process
+_sdp_registered = False
+
+# sockets are created non-blocking, saving the fcntl calls of setblocking(False)
+_L2CAP_SOCKET_TYPE = socket.SOCK_SEQPACKET | socket.SOCK_NONBLOCK | socket.SOCK_CLOEXEC
+
+# serialized placeholder report, sent until the Switch replies
+_EMPTY_INPUT_REPORT = bytes(InputReport())
+# seconds to wait for the first output report of the Switch after connecting
+OUTPUT_REPORT_TIMEOUT = 30
+
+# empty reports are sent at the HID poll interval during the first second
+HID_POLL_INTERVAL = 0.016
+EMPTY_REPORT_BURST_DURATION = 1.0
+
+
+def _setup_l2cap_socket(sock):
+    """
+    Enlarges the socket buffers, raises the socket priority and lowers the L2CAP flush timeout of the given socket.
+    Must be called before the socket is connected or listening.
+    """
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_PRIORITY, SOCKET_PRIORITY)
+
+    try:
+        options = sock.getsockopt(SOL_L2CAP, L2CAP_OPTIONS, struct.calcsize(_L2CAP_OPTIONS_FORMAT))
+        omtu, imtu, _, mode, fcs, max_tx, txwin_size = struct.unpack(_L2CAP_OPTIONS_FORMAT, options)
+        sock.setsockopt(SOL_L2CAP, L2CAP_OPTIONS, struct.pack(_L2CAP_OPTIONS_FORMAT, omtu, imtu, L2CAP_FLUSH_TIMEOUT,
+                                                              mode, fcs, max_tx, txwin_size))
+    except OSError as err:
+        logger.debug(f'Could not set L2CAP options: {err}')
+
+
+async def _connect(sock, address):
+    """
+    Connects the non-blocking socket without blocking the event loop.
+    loop.sock_connect is not used, uvloop resolves the address with getaddrinfo, which fails for Bluetooth addresses.
+    """
+    err = sock.connect_ex(address)
+    if err in (errno.EINPROGRESS, errno.EAGAIN):
+        loop = asyncio.get_running_loop()
+        writable = loop.create_future()
+
+        def _on_writable():
+            if not writable.done():
+                writable.set_result(None)
+
+        loop.add_writer(sock.fileno(), _on_writable)
+        try:
+            await writable
+        finally:
+            loop.remove_writer(sock.fileno())
+        err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+    if err != 0:
+        raise OSError(err, os.strerror(err))
+
 
 async def _send_empty_input_reports(transport):
-    report = InputReport()
-    for i in range(10):
-        await transport.write(report)
-        await asyncio.sleep(1)
+    """
+    Sends empty input reports until cancelled.
+    Reports are paced at the HID poll interval for the first second, then once per second.
+    """
+    start = time.monotonic()
+    while True:
+        await transport.write(_EMPTY_INPUT_REPORT)
+        if time.monotonic() - start < EMPTY_REPORT_BURST_DURATION:
+            await asyncio.sleep(HID_POLL_INTERVAL)
+        else:
+            await asyncio.sleep(1.0)
 
 
 async def create_hid_server(protocol_factory, ctl_psm=17, itr_psm=19, device_id=None, reconnect_bt_addr=None,
@@ -37,21 +119,24 @@ async def create_hid_server(protocol_factory, ctl_psm=17, itr_psm=19, device_id=
                       Otherwise, the function assumes an initial pairing with the console was already done
                       and reconnects to the provided Bluetooth address.
     :param capture_file: opened file to log incoming and outgoing messages
+    :raises asyncio.TimeoutError: if the Switch does not send an output report within OUTPUT_REPORT_TIMEOUT seconds
     :returns transport for input reports and protocol which handles incoming output reports
     """
+    global _sdp_registered
+    loop = asyncio.get_running_loop()
     protocol = protocol_factory()
 
     if reconnect_bt_addr is None:
-        ctl_sock = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_SEQPACKET, socket.BTPROTO_L2CAP)
-        itr_sock = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_SEQPACKET, socket.BTPROTO_L2CAP)
-        ctl_sock.setblocking(False)
-        itr_sock.setblocking(False)
+        ctl_sock = socket.socket(socket.AF_BLUETOOTH, _L2CAP_SOCKET_TYPE, socket.BTPROTO_L2CAP)
+        itr_sock = socket.socket(socket.AF_BLUETOOTH, _L2CAP_SOCKET_TYPE, socket.BTPROTO_L2CAP)
         ctl_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         itr_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        
-        try:
-            hid = HidDevice(device_id=device_id)
+        _setup_l2cap_socket(ctl_sock)
+        _setup_l2cap_socket(itr_sock)
+
+        hid = HidDevice(device_id=device_id)
 
+        try:
             ctl_sock.bind((hid.address, ctl_psm))
             itr_sock.bind((hid.address, itr_psm))
         except OSError as err:
@@ -63,10 +148,31 @@ async def create_hid_server(protocol_factory, ctl_psm=17, itr_psm=19, device_id=
             # The Switch does not connect to the sockets if we don't.
             # For more info see: https://github.com/mart1nro/joycontrol/issues/8
             logger.info('Restarting bluetooth service...')
-            await utils.run_system_command('systemctl restart bluetooth.service')
-            await asyncio.sleep(1)
+            proc = await asyncio.create_subprocess_exec('systemctl', 'restart', 'bluetooth.service',
+                                                        stdout=asyncio.subprocess.DEVNULL,
+                                                        stderr=asyncio.subprocess.PIPE)
+            _, stderr = await proc.communicate()
+            if proc.returncode != 0:
+                logger.error(f'Restarting bluetooth service failed with exit code {proc.returncode}: '
+                             f'{stderr.decode().strip()}')
+            else:
+                # bluez forgets registered profiles on restart
+                _sdp_registered = False
 
-            hid = HidDevice(device_id=device_id)
+                # wait until bluez is back up and the adapter is powered
+                for _ in range(50):
+                    # only query bluez once it owns its bus name again
+                    if hid.bluez_available():
+                        try:
+                            hid.refresh()
+                            if hid.is_powered():
+                                break
+                        except (ValueError, dbus.exceptions.DBusException):
+                            # the adapter is not available yet
+                            pass
+                    await asyncio.sleep(0.05)
+                else:
+                    hid.refresh()
 
             ctl_sock.bind((socket.BDADDR_ANY, ctl_psm))
             itr_sock.bind((socket.BDADDR_ANY, itr_psm))
@@ -74,25 +180,42 @@ async def create_hid_server(protocol_factory, ctl_psm=17, itr_psm=19, device_id=
         ctl_sock.listen(1)
         itr_sock.listen(1)
 
-        hid.powered(True)
-        hid.pairable(True)
+        # arm both accepts before advertising, the Switch may connect the channels in any order
+        accept_ctl = asyncio.ensure_future(loop.sock_accept(ctl_sock))
+        accept_itr = asyncio.ensure_future(loop.sock_accept(itr_sock))
 
-        logger.info('Advertising the Bluetooth SDP record...')
         try:
-            HidDevice.register_sdp_record(PROFILE_PATH)
-        except dbus.exceptions.DBusException as dbus_err:
-            # Already registered (If multiple controllers are being emulated and this method is called consecutive times)
-            logger.debug(dbus_err)
+            hid.powered(True)
+            hid.pairable(True)
+
+            logger.info('Advertising the Bluetooth SDP record...')
+            if not _sdp_registered:
+                try:
+                    HidDevice.register_sdp_record_bytes(_SDP_RECORD)
+                    _sdp_registered = True
+                except dbus.exceptions.DBusException as dbus_err:
+                    # Already registered
+                    # (If multiple controllers are being emulated and this method is called consecutive times)
+                    logger.debug(dbus_err)
+                    if dbus_err.get_dbus_name() == 'org.bluez.Error.AlreadyExists':
+                        _sdp_registered = True
 
-        # start advertising
-        hid.discoverable()
+            # start advertising
+            hid.discoverable()
 
-        logger.info('Waiting for Switch to connect... Please open the "Change Grip/Order" menu.')
+            logger.info('Waiting for Switch to connect... Please open the "Change Grip/Order" menu.')
+
+            (client_ctl, ctl_address), (client_itr, itr_address) = await asyncio.gather(accept_ctl, accept_itr)
+        except BaseException:
+            # also on cancellation, don't leave the accepts pending on open sockets
+            accept_ctl.cancel()
+            accept_itr.cancel()
+            await asyncio.gather(accept_ctl, accept_itr, return_exceptions=True)
+            ctl_sock.close()
+            itr_sock.close()
+            raise
 
-        loop = asyncio.get_event_loop()
-        client_ctl, ctl_address = await loop.sock_accept(ctl_sock)
         logger.info(f'Accepted connection at psm {ctl_psm} from {ctl_address}')
-        client_itr, itr_address = await loop.sock_accept(itr_sock)
         logger.info(f'Accepted connection at psm {itr_psm} from {itr_address}')
         assert ctl_address[0] == itr_address[0]
 
@@ -102,26 +225,33 @@ async def create_hid_server(protocol_factory, ctl_psm=17, itr_psm=19, device_id=
 
     else:
         # Reconnection to reconnect_bt_addr
-        client_ctl = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_SEQPACKET, socket.BTPROTO_L2CAP)
-        client_itr = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_SEQPACKET, socket.BTPROTO_L2CAP)
-        client_ctl.connect((reconnect_bt_addr, ctl_psm))
-        client_itr.connect((reconnect_bt_addr, itr_psm))
-        client_ctl.setblocking(False)
-        client_itr.setblocking(False)
+        client_ctl = socket.socket(socket.AF_BLUETOOTH, _L2CAP_SOCKET_TYPE, socket.BTPROTO_L2CAP)
+        client_itr = socket.socket(socket.AF_BLUETOOTH, _L2CAP_SOCKET_TYPE, socket.BTPROTO_L2CAP)
+        _setup_l2cap_socket(client_ctl)
+        _setup_l2cap_socket(client_itr)
+
+        # The HID spec requires the control channel to be established before the interrupt channel,
+        # so the connects are awaited in order, but without blocking the event loop.
+        await _connect(client_ctl, (reconnect_bt_addr, ctl_psm))
+        await _connect(client_itr, (reconnect_bt_addr, itr_psm))
 
     # create transport for the established connection and activate the HID protocol
-    transport = L2CAP_Transport(asyncio.get_event_loop(), protocol, client_itr, client_ctl, 50, capture_file=capture_file)
+    transport = L2CAP_Transport(loop, protocol, client_itr, client_ctl, 50, capture_file=capture_file)
     protocol.connection_made(transport)
 
     # HACK: send some empty input reports until the Switch decides to reply
     future = asyncio.ensure_future(_send_empty_input_reports(transport))
-    await protocol.wait_for_output_report()
-    """
-    future.cancel()
     try:
-        await future
-    except asyncio.CancelledError:
-        pass
-    """
+        try:
+            await asyncio.wait_for(protocol.wait_for_output_report(), timeout=OUTPUT_REPORT_TIMEOUT)
+        finally:
+            # the sender is cancelled as soon as the Switch replies
+            future.cancel()
+            await asyncio.gather(future, return_exceptions=True)
+    except asyncio.TimeoutError:
+        logger.error(f'Switch did not reply within {OUTPUT_REPORT_TIMEOUT} seconds.')
+        # the sender is stopped, so the sockets can be closed
+        await transport.close()
+        raise
 
     return protocol.transport, protocol
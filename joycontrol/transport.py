@@ -24,6 +24,8 @@ class L2CAP_Transport(asyncio.Transport):
         self._ctr_sock = ctr_sock
 
         self._read_buffer_size = read_buffer_size
+        # preallocated receive buffer, reused for every read
+        self._read_buffer = bytearray(read_buffer_size)
 
         self._extra_info = {
             'peername': self._itr_sock.getpeername(),
@@ -93,10 +95,14 @@ class L2CAP_Transport(asyncio.Transport):
         Read data from the underlying socket. This function waits,
         if reading is paused using the pause_reading function.
 
-        :returns bytes
+        The data is received into a reused buffer without copying it.
+        It is only valid until the next read call, copy it if it has to be kept longer.
+
+        :returns memoryview of the received bytes
         """
         await self._is_reading.wait()
-        data = await self._loop.sock_recv(self._itr_sock, self._read_buffer_size)
+        nbytes = await self._loop.sock_recv_into(self._itr_sock, self._read_buffer)
+        data = memoryview(self._read_buffer)[:nbytes]
 
         # logger.debug(f'received "{list(data)}"')
 
@@ -134,13 +140,16 @@ class L2CAP_Transport(asyncio.Transport):
 
     def set_read_buffer_size(self, size):
         self._read_buffer_size = size
+        self._read_buffer = bytearray(size)
 
     async def write(self, data: Any) -> None:
-        if isinstance(data, bytes):
-            _bytes = data
+        if type(data) is bytes:
+            # fast path for already serialized reports
+            await self._send(data)
         else:
-            _bytes = bytes(data)
+            await self._send(bytes(data))
 
+    async def _send(self, _bytes: bytes) -> None:
         if self._capture_file is not None:
             # write data to log file
             _time = struct.pack('d', time.time())
@@ -150,7 +159,13 @@ class L2CAP_Transport(asyncio.Transport):
         # logger.debug(f'sending "{_bytes}"')
 
         try:
-            await self._loop.sock_sendall(self._itr_sock, _bytes)
+            # try to send directly, only wait for the socket to become writable if the send buffer is full
+            try:
+                n = self._itr_sock.send(_bytes)
+            except (BlockingIOError, InterruptedError):
+                n = 0
+            if n < len(_bytes):
+                await self._loop.sock_sendall(self._itr_sock, memoryview(_bytes)[n:])
         except OSError as err:
             logger.error(err)
             self._protocol.connection_lost()
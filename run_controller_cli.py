@@ -4,17 +4,30 @@ import argparse
 import asyncio
 import logging
 import os
+import signal
 import keyboard
-import time
-import shelve
-import board
+from contextlib import suppress
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
 
 from aioconsole import ainput
 
+try:
+    import evdev
+except ImportError:
+    evdev = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 from joycontrol import logging_default as log, utils
 from joycontrol.command_line_interface import ControllerCLI
 from joycontrol.controller import Controller
-from joycontrol.controller_state import ControllerState, button_push, StickState
+from joycontrol.controller_state import ControllerState, button_push, button_sequence, button_push_sequence, StickState
 from joycontrol.memory import FlashMemory
 from joycontrol.protocol import controller_protocol_factory
 from joycontrol.server import create_hid_server
@@ -58,279 +71,221 @@ Options:
 """
 
 
-def keyToConBtn(
-        key):  # this method translates recorded key events to respective controller buttons pressed for recording playback
-    namedKey = None
-    keyBinding = {'q': 'left', 'w': 'lStickUp', 'e': 'up', 'r': 'zl', 't': 'l', 'y': 'r', 'u': 'zr', 'i': 'rStickUp',
-                  'a': 'lStickL', 's': 'lStickDown', 'd': 'lStickR', 'f': 'right', 'g': 'capture', 'h': 'home',
-                  'j': 'rStickL', 'k': 'rStickDown', 'l': 'rStickR', 'c': 'down', 'up': 'x', 'down': 'b', 'left': 'y',
-                  'right': 'a', '-': 'minus', '+': 'plus'}
-    testKeys = ['q', 'w', 'e', 'r', 't', 'y', 'u', 'i', 'a', 's', 'd', 'f', 'g', 'h', 'j', 'k', 'l', 'c', 'up', 'down',
-                'left', 'right', '+', '-']
-    for testKey in testKeys:
-        testKeyCode = keyboard.key_to_scan_codes(testKey)
-        # print('testKeyCode:')
-        # print(testKeyCode)
-        if testKeyCode[0] == key:
-            namedKey = testKey
-            # print('namedKey:')
-            # print(namedKey)
-    if namedKey in keyBinding:
-        conBtnPressed = keyBinding[namedKey]
-        return conBtnPressed
-
-
-def bindKeyboard(
-        controller_state: ControllerState):  # this method binds specific keys to each button on the pro controller for keyboard control
-    # callbacks:
-    def APress(self):
-        controller_state.button_state.set_button('a')
-
-    def AUnpress(self):
-        controller_state.button_state.set_button('a', pushed=False)
-
-    def BPress(self):
-        controller_state.button_state.set_button('b')
-
-    def BUnpress(self):
-        controller_state.button_state.set_button('b', pushed=False)
-
-    def XPress(self):
-        controller_state.button_state.set_button('x')
-
-    def XUnpress(self):
-        controller_state.button_state.set_button('x', pushed=False)
-
-    def YPress(self):
-        controller_state.button_state.set_button('y')
-
-    def YUnpress(self):
-        controller_state.button_state.set_button('y', pushed=False)
-
-    def UPPress(self):
-        controller_state.button_state.set_button('up')
-
-    def UPUnpress(self):
-        controller_state.button_state.set_button('up', pushed=False)
-
-    def DOWNPress(self):
-        controller_state.button_state.set_button('down')
-
-    def DOWNUnpress(self):
-        controller_state.button_state.set_button('down', pushed=False)
-
-    def LEFTPress(self):
-        controller_state.button_state.set_button('left')
-
-    def LEFTUnpress(self):
-        controller_state.button_state.set_button('left', pushed=False)
-
-    def RIGHTPress(self):
-        controller_state.button_state.set_button('right')
-
-    def RIGHTUnpress(self):
-        controller_state.button_state.set_button('right', pushed=False)
-
-    def PLUSPress(self):
-        controller_state.button_state.set_button('plus')
-
-    def PLUSUnpress(self):
-        controller_state.button_state.set_button('plus', pushed=False)
-
-    def MINUSPress(self):
-        controller_state.button_state.set_button('minus')
-
-    def MINUSUnpress(self):
-        controller_state.button_state.set_button('minus', pushed=False)
-
-    def HOMEPress(self):
-        controller_state.button_state.set_button('home')
-
-    def HOMEUnpress(self):
-        controller_state.button_state.set_button('home', pushed=False)
-
-    def CAPPress(self):
-        controller_state.button_state.set_button('capture')
-
-    def CAPUnpress(self):
-        controller_state.button_state.set_button('capture', pushed=False)
-
-    def LBUMPPress(self):
-        controller_state.button_state.set_button('l')
-
-    def LBUMPUnpress(self):
-        controller_state.button_state.set_button('l', pushed=False)
-
-    def RBUMPPress(self):
-        controller_state.button_state.set_button('r')
-
-    def RBUMPUnpress(self):
-        controller_state.button_state.set_button('r', pushed=False)
+# keyboard keys and the controller buttons they are bound to for keyboard control and recording playback
+KEY_BINDING: Dict[str, str] = {
+    'q': 'left', 'w': 'lStickUp', 'e': 'up', 'r': 'zl', 't': 'l', 'y': 'r', 'u': 'zr', 'i': 'rStickUp',
+    'a': 'lStickL', 's': 'lStickDown', 'd': 'lStickR', 'f': 'right', 'g': 'capture', 'h': 'home',
+    'j': 'rStickL', 'k': 'rStickDown', 'l': 'rStickR', 'c': 'down', 'up': 'x', 'down': 'b', 'left': 'y',
+    'right': 'a', '-': 'minus', '+': 'plus'
+}
 
-    def ZLPress(self):
-        controller_state.button_state.set_button('zl')
+# stick bindings of KEY_BINDING -> (stick side, direction)
+STICK_BINDING: Dict[str, Tuple[str, str]] = {
+    'lStickUp': ('l', 'up'), 'lStickDown': ('l', 'down'), 'lStickL': ('l', 'left'), 'lStickR': ('l', 'right'),
+    'rStickUp': ('r', 'up'), 'rStickDown': ('r', 'down'), 'rStickL': ('r', 'left'), 'rStickR': ('r', 'right')
+}
 
-    def ZLUnpress(self):
-        controller_state.button_state.set_button('zl', pushed=False)
 
-    def ZRPress(self):
-        controller_state.button_state.set_button('zr')
-
-    def ZRUnpress(self):
-        controller_state.button_state.set_button('zr', pushed=False)
-
-        # Stick state handler callbacks
-
-    LeftStick = controller_state.l_stick_state
-    RightStick = controller_state.r_stick_state
-
-    def UpLStickPress(self):
-        ControllerCLI._set_stick(LeftStick, 'up', None)
-
-    def DownLStickPress(self):
-        ControllerCLI._set_stick(LeftStick, 'down', None)
-
-    def LeftLStickPress(self):
-        ControllerCLI._set_stick(LeftStick, 'left', None)
-
-    def RightLStickPress(self):
-        ControllerCLI._set_stick(LeftStick, 'right', None)
+@lru_cache(maxsize=None)
+def _scan_to_btn() -> Dict[int, str]:
+    """
+    :returns dict mapping scan codes to controller buttons. Built on first use, because resolving scan codes
+             initializes the keyboard backend, which requires root.
+    """
+    return {keyboard.key_to_scan_codes(key)[0]: btn for key, btn in KEY_BINDING.items()}
 
-    def LStickUnpress(self):
-        ControllerCLI._set_stick(LeftStick, 'center', None)
 
-        # Right Stick
+def keyToConBtn(
+        key: int) -> Optional[str]:  # this method translates recorded key events to respective controller buttons pressed for recording playback
+    return _scan_to_btn().get(key)
 
-    def UpRStickPress(self):
-        ControllerCLI._set_stick(RightStick, 'up', None)
 
-    def DownRStickPress(self):
-        ControllerCLI._set_stick(RightStick, 'down', None)
+def _keyboard_actions(controller_state: ControllerState):
+    """
+    :returns dict mapping the scan codes of the KEY_BINDING keys to (press action, release action)
+             of the controller state
+    """
+    button_state = controller_state.button_state
+    sticks = {'l': controller_state.l_stick_state, 'r': controller_state.r_stick_state}
+
+    # stick positions are computed once from the calibration data
+    positions = {side: stick.get_positions() for side, stick in sticks.items() if stick is not None}
+
+    actions = {}
+    for scan_code, target in _scan_to_btn().items():
+        if target in STICK_BINDING:
+            side, direction = STICK_BINDING[target]
+            if side not in positions:
+                # controller has no such stick
+                continue
+            action = (partial(sticks[side].set_position, positions[side][direction]),
+                      partial(sticks[side].set_position, positions[side]['center']))
+        else:
+            action = (partial(button_state.set_button, target),
+                      partial(button_state.set_button, target, pushed=False))
+        actions[scan_code] = action
+    return actions
 
-    def LeftRStickPress(self):
-        ControllerCLI._set_stick(RightStick, 'left', None)
 
-    def RightRStickPress(self):
-        ControllerCLI._set_stick(RightStick, 'right', None)
+def bindKeyboard(
+        controller_state: ControllerState):  # this method binds specific keys to each button on the pro controller for keyboard control
+    """
+    Key events are passed from the hook thread of the keyboard library to the event loop,
+    where they are applied to the controller state.
+    :returns consumer task applying the key events, cancel it to stop
+    """
+    actions = _keyboard_actions(controller_state)
+    loop = asyncio.get_event_loop()
+    events = asyncio.Queue(maxsize=256)
 
-    def RStickUnpress(self):
-        ControllerCLI._set_stick(RightStick, 'center', None)
+    def _put(event):
+        try:
+            events.put_nowait(event)
+        except asyncio.QueueFull:
+            # drop events instead of stalling, the consumer is too far behind anyway
+            pass
+
+    def _dispatch(event):
+        # runs in the hook thread of the keyboard library, only hand the event over
+        if event.scan_code in actions:
+            loop.call_soon_threadsafe(_put, (event.scan_code, event.event_type == keyboard.KEY_DOWN))
+
+    async def _consumer():
+        # a single hook instead of a press and release listener per key, removed when the consumer stops
+        hook = keyboard.hook(_dispatch)
+        try:
+            # scan code -> last applied pushed state
+            pushed = {}
+            while True:
+                scan_code, is_down = await events.get()
+                # skips key repeats and releases of keys that are already released
+                if pushed.get(scan_code, False) == is_down:
+                    continue
+                pushed[scan_code] = is_down
+
+                press, release = actions[scan_code]
+                if is_down:
+                    press()
+                else:
+                    release()
+        finally:
+            keyboard.unhook(hook)
 
-    # key listeners
-    keyboard.on_press_key('q', LEFTPress)
-    keyboard.on_release_key('q', LEFTUnpress)
+    consumer = asyncio.ensure_future(_consumer())
+    consumer.add_done_callback(utils.create_error_check_callback(ignore=asyncio.CancelledError))
 
-    keyboard.on_press_key('w', UpLStickPress)
-    keyboard.on_release_key('w', LStickUnpress)
+    print(' ')
+    # print('keys bound')
+    return consumer
 
-    keyboard.on_press_key('e', UPPress)
-    keyboard.on_release_key('e', UPUnpress)
 
-    keyboard.on_press_key('r', ZLPress)
-    keyboard.on_release_key('r', ZLUnpress)
+def _find_evdev_keyboard():
+    """
+    :returns path of the first input device reporting letter keys
+    """
+    for path in evdev.list_devices():
+        device = evdev.InputDevice(path)
+        keys = device.capabilities().get(evdev.ecodes.EV_KEY, [])
+        device.close()
+        if evdev.ecodes.KEY_Q in keys:
+            return path
+    raise ValueError('No keyboard input device found.')
 
-    keyboard.on_press_key('t', LBUMPPress)
-    keyboard.on_release_key('t', LBUMPUnpress)
 
-    keyboard.on_press_key('y', RBUMPPress)
-    keyboard.on_release_key('y', RBUMPUnpress)
+def bindKeyboardEvdev(controller_state: ControllerState, device_path=None):
+    """
+    Binds the same keys as bindKeyboard, but reads the key events directly from an evdev input device
+    on the event loop instead of going through the hook thread of the keyboard library.
+    :param controller_state: Emulated controller state
+    :param device_path: input device, e.g. /dev/input/by-id/...-kbd. If None, the first keyboard is used.
+    :returns function that stops listening and closes the input device
+    """
+    if evdev is None:
+        raise ValueError('Keyboard control via evdev requires the "evdev" package.')
 
-    keyboard.on_press_key('u', ZRPress)
-    keyboard.on_release_key('u', ZRUnpress)
+    if device_path is None:
+        device_path = _find_evdev_keyboard()
+    device = evdev.InputDevice(device_path)
 
-    keyboard.on_press_key('i', UpRStickPress)
-    keyboard.on_release_key('i', RStickUnpress)
+    # on Linux, the scan codes of the keyboard library are the evdev key codes
+    actions = _keyboard_actions(controller_state)
 
-    keyboard.on_press_key('a', LeftLStickPress)
-    keyboard.on_release_key('a', LStickUnpress)
+    def _drain():
+        try:
+            for event in device.read():
+                if event.type != evdev.ecodes.EV_KEY or event.code not in actions:
+                    continue
+                press, release = actions[event.code]
+                # 1 = key down, 0 = key up, 2 = auto repeat (ignored)
+                if event.value == 1:
+                    press()
+                elif event.value == 0:
+                    release()
+        except BlockingIOError:
+            pass
 
-    keyboard.on_press_key('s', DownLStickPress)
-    keyboard.on_release_key('s', LStickUnpress)
+    loop = asyncio.get_event_loop()
+    loop.add_reader(device.fd, _drain)
 
-    keyboard.on_press_key('d', RightLStickPress)
-    keyboard.on_release_key('d', LStickUnpress)
+    def stop():
+        loop.remove_reader(device.fd)
+        device.close()
 
-    keyboard.on_press_key('f', RIGHTPress)
-    keyboard.on_release_key('f', RIGHTUnpress)
+    return stop
 
-    keyboard.on_press_key('g', CAPPress)
-    keyboard.on_release_key('g', CAPUnpress)
 
-    keyboard.on_press_key('h', HOMEPress)
-    keyboard.on_release_key('h', HOMEUnpress)
+def _press_button(button: str) -> Callable[[ControllerState], None]:
+    def action(controller_state: ControllerState) -> None:
+        controller_state.button_state.set_button(button)
+    return action
 
-    keyboard.on_press_key('j', LeftRStickPress)
-    keyboard.on_release_key('j', RStickUnpress)
 
-    keyboard.on_press_key('k', DownRStickPress)
-    keyboard.on_release_key('k', RStickUnpress)
+def _move_stick(side: str, direction: str) -> Callable[[ControllerState], None]:
+    def action(controller_state: ControllerState) -> None:
+        stick = controller_state.l_stick_state if side == 'l' else controller_state.r_stick_state
+        # same positions as keyboard control
+        stick.set_position(stick.get_positions()[direction])
+    return action
 
-    keyboard.on_press_key('l', RightRStickPress)
-    keyboard.on_release_key('l', RStickUnpress)
 
-    keyboard.on_press_key('c', DOWNPress)
-    keyboard.on_release_key('c', DOWNUnpress)
+# recorded button/stick name -> action applying it to a controller state
+_PLAYBACK_ACTIONS: Dict[str, Callable[[ControllerState], None]] = {
+    **{button: _press_button(button) for button in ('x', 'y', 'b', 'a', 'plus', 'minus', 'home', 'capture',
+                                                    'zl', 'zr', 'l', 'r', 'up', 'down', 'left', 'right')},
+    **{name: _move_stick(side, direction) for name, (side, direction) in STICK_BINDING.items()}
+}
 
-    keyboard.on_press_key('+', PLUSPress)
-    keyboard.on_release_key('+', PLUSUnpress)
 
-    keyboard.on_press_key('-', MINUSPress)
-    keyboard.on_release_key('-', MINUSUnpress)
+async def directStateSet(btnTrans: str,
+                         controller_state: ControllerState) -> None:  # this method sets button/stick states during recording playback (button PRESS/ stick UDLR)
+    action = _PLAYBACK_ACTIONS.get(btnTrans)
+    if action is not None:
+        action(controller_state)
+        await controller_state.send()
 
-    keyboard.on_press_key('up', XPress)
-    keyboard.on_release_key('up', XUnpress)
 
-    keyboard.on_press_key('down', BPress)
-    keyboard.on_release_key('down', BUnpress)
+# pause after a push to give menus time to react, tune this to speed up or slow down all macros
+MENU_GRACE = 0.08
 
-    keyboard.on_press_key('left', YPress)
-    keyboard.on_release_key('left', YUnpress)
 
-    keyboard.on_press_key('right', APress)
-    keyboard.on_release_key('right', AUnpress)
-    print(' ')
-    # print('keys bound')
+async def tap(controller_state, button, post=MENU_GRACE):
+    """
+    Pushes the button and waits for the menu to react.
+    """
+    await button_push(controller_state, button)
+    await asyncio.sleep(post)
 
 
-async def directStateSet(btnTrans,
-                         controller_state: ControllerState):  # this method sets button/stick states during recording playback (button PRESS/ stick UDLR)
-    LeftStick = controller_state.l_stick_state
-    RightStick = controller_state.r_stick_state
-    btnsList = ['x', 'y', 'b', 'a', 'plus', 'minus', 'home', 'capture', 'zl', 'zr', 'l', 'r', 'up', 'down', 'left',
-                'right']
-    lStickList = ['lStickUp', 'lStickDown', 'lStickL', 'lStickR']
-    rStickList = ['rStickUp', 'rStickDown', 'rStickL', 'rStickR']
-    if btnTrans in btnsList:
-        # print(btnTrans)
-        controller_state.button_state.set_button(btnTrans)
-        await controller_state.send()
-    elif btnTrans in lStickList:
-        # print(btnTrans)
-        if btnTrans == 'lStickDown':
-            ControllerCLI._set_stick(LeftStick, 'down', None)
-            await controller_state.send()
-        elif btnTrans == 'lStickUp':
-            ControllerCLI._set_stick(LeftStick, 'up', None)
-            await controller_state.send()
-        elif btnTrans == 'lStickL':
-            ControllerCLI._set_stick(LeftStick, 'left', None)
-            await controller_state.send()
-        elif btnTrans == 'lStickR':
-            ControllerCLI._set_stick(LeftStick, 'right', None)
-            await controller_state.send()
-    elif btnTrans in rStickList:
-        if btnTrans == 'rStickDown':
-            ControllerCLI._set_stick(RightStick, 'down', None)
-            await controller_state.send()
-        elif btnTrans == 'rStickUp':
-            ControllerCLI._set_stick(RightStick, 'up', None)
-            await controller_state.send()
-        elif btnTrans == 'rStickL':
-            ControllerCLI._set_stick(RightStick, 'left', None)
-            await controller_state.send()
-        elif btnTrans == 'rStickR':
-            ControllerCLI._set_stick(RightStick, 'right', None)
-            await controller_state.send()
+# raid code 14544444 on the keypad of run_auto_host, confirmed with plus
+RAID_CODE_INPUT = ('a',           # 1
+                   'down', 'a',   # 4
+                   'right', 'a',  # 5
+                   'left', 'a',   # 4
+                   'l', 'a',      # 4
+                   'l', 'a',      # 4
+                   'l', 'a',      # 4
+                   'l', 'a',      # 4
+                   'plus')
 
 
 async def date_skipper(controller_state: ControllerState):
@@ -340,21 +295,13 @@ async def date_skipper(controller_state: ControllerState):
     """
     number_days = 1880
 
-    if controller_state.get_controller() != Controller.PRO_CONTROLLER:
-        raise ValueError('This script only works with the Pro Controller!')
-
     # waits until controller is fully connected
     await controller_state.connect()
 
     # skip a day
 
     # navigate to settings menu
-    await button_push(controller_state, 'right')
-    await button_push(controller_state, 'b')
-    await button_push(controller_state, 'right')
-    await button_push(controller_state, 'down')
-    await button_push(controller_state, 'right')
-    await button_push(controller_state, 'a')
+    await button_sequence(controller_state, 'right', 'b', 'right', 'down', 'right', 'a')
 
     # go all the way down
     await button_push(controller_state, 'down', sec=2.5)
@@ -362,51 +309,31 @@ async def date_skipper(controller_state: ControllerState):
     # system
     await button_push(controller_state, 'right')
     # date & time menu
-    for _ in range(4):
-        await button_push(controller_state, 'down')
-        await asyncio.sleep(0.08)
+    await button_push_sequence(controller_state, 'down', 'down', 'down', 'down', interval=0.1 + MENU_GRACE)
     await button_push(controller_state, 'a')
     await asyncio.sleep(0.2)
 
     # date & time
-    for _ in range(2):
-        await button_push(controller_state, 'down')
-        await asyncio.sleep(0.08)
-    await button_push(controller_state, 'a')
-    await asyncio.sleep(0.08)
+    await button_push_sequence(controller_state, 'down', 'down', interval=0.1 + MENU_GRACE)
+    await tap(controller_state, 'a')
 
     # increment year
     # go all the way right
     await button_push(controller_state, 'right', sec=1)
 
     for i in range(number_days):
-        print(str(i) + "/" + str(number_days))
-        for _ in range(4):
-            await button_push(controller_state, 'left')
-            await asyncio.sleep(0.04)
+        logger.info(f'{i}/{number_days}')
+        await button_push_sequence(controller_state, 'left', 'left', 'left', 'left', interval=0.14)
         await button_push(controller_state, 'up')
-        for _ in range(4):
-            await button_push(controller_state, 'right')
-            await asyncio.sleep(0.04)
-        await button_push(controller_state, 'a')
-        await asyncio.sleep(0.08)
+        await button_push_sequence(controller_state, 'right', 'right', 'right', 'right', interval=0.14)
+        await tap(controller_state, 'a')
 
         if ((i + 1) % 30) == 0:
-            await button_push(controller_state, 'up')
-            await asyncio.sleep(0.04)
-            await button_push(controller_state, 'up')
-            await asyncio.sleep(0.04)
-            await button_push(controller_state, 'a')
-            await asyncio.sleep(0.1)
-            await button_push(controller_state, 'a')
-            await asyncio.sleep(0.1)
-            await button_push(controller_state, 'down')
-            await asyncio.sleep(0.04)
-            await button_push(controller_state, 'down')
-            await asyncio.sleep(0.04)
+            await button_push_sequence(controller_state, 'up', 'up', interval=0.14)
+            await button_push_sequence(controller_state, 'a', 'a', interval=0.2)
+            await button_push_sequence(controller_state, 'down', 'down', interval=0.14)
 
-        await button_push(controller_state, 'a')
-        await asyncio.sleep(0.08)
+        await tap(controller_state, 'a')
 
 
 async def run_auto_host(controller_state: ControllerState):
@@ -417,9 +344,6 @@ async def run_auto_host(controller_state: ControllerState):
     # frames_away = 3
     frames_away = 0 # for hardlocking
 
-    if controller_state.get_controller() != Controller.PRO_CONTROLLER:
-        raise ValueError('This script only works with the Pro Controller!')
-
     # waits until controller is fully connected
     await controller_state.connect()
 
@@ -428,7 +352,7 @@ async def run_auto_host(controller_state: ControllerState):
     while True:
         for _ in range(frames_away):
             # start inviting
-            print("start inviting")
+            logger.info("start inviting")
             await button_push(controller_state, 'a')
             await button_push(controller_state, 'a')
             await asyncio.sleep(1.0)
@@ -440,75 +364,52 @@ async def run_auto_host(controller_state: ControllerState):
             await asyncio.sleep(2.0)
 
             # date skip
-            print("date skip")
+            logger.info("date skip")
             await button_push(controller_state, 'home')
             await asyncio.sleep(0.4)
 
             # navigate to settings menu
-            print("navigate to settings menu")
-            await button_push(controller_state, 'right')
-            await button_push(controller_state, 'b')
-            await button_push(controller_state, 'right')
-            await button_push(controller_state, 'down')
-            await button_push(controller_state, 'right')
-            await button_push(controller_state, 'a')
+            logger.info("navigate to settings menu")
+            await button_sequence(controller_state, 'right', 'b', 'right', 'down', 'right', 'a')
 
             # go all the way down
-            print("go all the way down")
+            logger.info("go all the way down")
             await button_push(controller_state, 'down', sec=2.5)
             # system
             await button_push(controller_state, 'a')
             # date & time menu
-            for _ in range(4):
-                await button_push(controller_state, 'down')
-                await asyncio.sleep(0.08)
+            await button_push_sequence(controller_state, 'down', 'down', 'down', 'down', interval=0.1 + MENU_GRACE)
             await button_push(controller_state, 'a')
             await asyncio.sleep(0.1)
 
             # date & time
-            for _ in range(3):
-                await button_push(controller_state, 'down')
-                await asyncio.sleep(0.08)
-            await button_push(controller_state, 'a')
-            await asyncio.sleep(0.08)
+            await button_push_sequence(controller_state, 'down', 'down', 'down', interval=0.1 + MENU_GRACE)
+            await tap(controller_state, 'a')
 
             # increment year
-            print("increment year")
+            logger.info("increment year")
 
-            await button_push(controller_state, 'right')
-            await button_push(controller_state, 'y')
-            await button_push(controller_state, 'right')
-            await button_push(controller_state, 'y')
-            await button_push(controller_state, 'up')
-            await button_push(controller_state, 'a')
-            await button_push(controller_state, 'y')
-            await button_push(controller_state, 'a')
-            await button_push(controller_state, 'y')
-            await button_push(controller_state, 'a')
-            await button_push(controller_state, 'y')
-            await button_push(controller_state, 'a')
-            await button_push(controller_state, 'y')
-            await button_push(controller_state, 'a')
+            await button_sequence(controller_state, 'right', 'y', 'right', 'y', 'up',
+                                  'a', 'y', 'a', 'y', 'a', 'y', 'a', 'y', 'a')
 
             # go back to game
-            print("go back to game")
-            await asyncio.sleep(0.08)
+            logger.info("go back to game")
+            await asyncio.sleep(MENU_GRACE)
             await button_push(controller_state, 'home')
             await asyncio.sleep(1)
             await button_push(controller_state, 'a')
             await asyncio.sleep(1.5)
 
             # quit lobby
-            print("quit lobby")
-            await button_push(controller_state, 'down')
-            await asyncio.sleep(0.08)
+            logger.info("quit lobby")
+            await tap(controller_state, 'down')
             await button_push(controller_state, 'a')
             await asyncio.sleep(1.2)
             await button_push(controller_state, 'a')
             await asyncio.sleep(4)
 
         # collect watts
-        print("collect watts")
+        logger.info("collect watts")
         await button_push(controller_state, 'a')
         await asyncio.sleep(1.0)
         await button_push(controller_state, 'b')
@@ -519,7 +420,7 @@ async def run_auto_host(controller_state: ControllerState):
         await asyncio.sleep(1.0)
 
         # connect to internet
-        print("connect to internet")
+        logger.info("connect to internet")
         await button_push(controller_state, 'y')
         await asyncio.sleep(1.0)
         await button_push(controller_state, 'plus')
@@ -530,30 +431,15 @@ async def run_auto_host(controller_state: ControllerState):
         await asyncio.sleep(1.0)
 
         # start raid
-        print("start raid")
+        logger.info("start raid")
         await button_push(controller_state, 'a')
         await asyncio.sleep(7)
 
         # enter code
-        print("enter code")
+        logger.info("enter code")
         await button_push(controller_state, 'plus')
         await asyncio.sleep(1.0)
-        await button_push(controller_state, 'a')  # 1
-        await button_push(controller_state, 'down')
-        await button_push(controller_state, 'a')  # 4
-        await button_push(controller_state, 'right')
-        await button_push(controller_state, 'a')  # 5
-        await button_push(controller_state, 'left')
-        await button_push(controller_state, 'a')  # 4
-        await button_push(controller_state, 'l')
-        await button_push(controller_state, 'a')  # 4
-        await button_push(controller_state, 'l')
-        await button_push(controller_state, 'a')  # 4
-        await button_push(controller_state, 'l')
-        await button_push(controller_state, 'a')  # 4
-        await button_push(controller_state, 'l')
-        await button_push(controller_state, 'a')  # 4
-        await button_push(controller_state, 'plus')
+        await button_sequence(controller_state, *RAID_CODE_INPUT)
         await asyncio.sleep(1)
         await button_push(controller_state, 'a')
         await asyncio.sleep(0.2)
@@ -566,7 +452,7 @@ async def run_auto_host(controller_state: ControllerState):
         await button_push(controller_state, 'a')
 
         # wait for lobby to fill
-        print("wait for lobby to fill")
+        logger.info("wait for lobby to fill")
         # await asyncio.sleep(65)  # FIXME
         await asyncio.sleep(6)
         await button_push(controller_state, 'home')
@@ -579,9 +465,7 @@ async def run_auto_host(controller_state: ControllerState):
         await asyncio.sleep(0.1)
         await button_push(controller_state, 'a')
         await asyncio.sleep(0.1)
-        for _ in range(22):
-            await button_push(controller_state, 'a')
-            await asyncio.sleep(1)
+        await button_push_sequence(controller_state, *('a',) * 22, interval=1.1)
 
         await button_push(controller_state, 'home')
         await asyncio.sleep(1.5)
@@ -590,7 +474,7 @@ async def run_auto_host(controller_state: ControllerState):
         # add friends while waiting
 
         # start raid
-        print("start raid")
+        logger.info("start raid")
         await button_push(controller_state, 'up')
         await asyncio.sleep(0.1)
         await button_push(controller_state, 'a')
@@ -607,13 +491,11 @@ async def run_auto_host(controller_state: ControllerState):
         await asyncio.sleep(0.4)
         await button_push(controller_state, 'a')
         # keep mashing in case someone hasn't readied up
-        for _ in range(35):
-            await button_push(controller_state, 'a')
-            await asyncio.sleep(1)
+        await button_push_sequence(controller_state, *('a',) * 35, interval=1.1)
 
 
         # close game
-        print("close game")
+        logger.info("close game")
         # await asyncio.sleep(15)
         await button_push(controller_state, 'home')
         await asyncio.sleep(1)
@@ -623,38 +505,29 @@ async def run_auto_host(controller_state: ControllerState):
         await asyncio.sleep(4)
 
         # reset time
-        print("reset time")
+        logger.info("reset time")
 
         # navigate to settings menu
-        await button_push(controller_state, 'right')
-        await button_push(controller_state, 'b')
-        await button_push(controller_state, 'right')
-        await button_push(controller_state, 'down')
-        await button_push(controller_state, 'right')
-        await button_push(controller_state, 'a')
+        await button_sequence(controller_state, 'right', 'b', 'right', 'down', 'right', 'a')
         # go all the way down
         await button_push(controller_state, 'down', sec=2.5)
         await asyncio.sleep(0.1)
         # system
         await button_push(controller_state, 'right')
         # date & time menu
-        for _ in range(4):
-            await button_push(controller_state, 'down')
-            await asyncio.sleep(0.08)
+        await button_push_sequence(controller_state, 'down', 'down', 'down', 'down', interval=0.1 + MENU_GRACE)
         await button_push(controller_state, 'a')
         await asyncio.sleep(0.2)
 
         # turn on & off sync clock
-        print("turn on & off sync clock")
-        await button_push(controller_state, 'a')
-        await asyncio.sleep(0.08)
-        await button_push(controller_state, 'a')
-        await asyncio.sleep(0.08)
+        logger.info("turn on & off sync clock")
+        await tap(controller_state, 'a')
+        await tap(controller_state, 'a')
         await button_push(controller_state, 'home')
         await asyncio.sleep(1.5)
 
         # start up game again, wait, and mash through until in front of den
-        print("start up game again, wait, and mash through until in front of den")
+        logger.info("start up game again, wait, and mash through until in front of den")
         await button_push(controller_state, 'a')
         await asyncio.sleep(18)
         await button_push(controller_state, 'a')
@@ -668,9 +541,6 @@ async def friend_remover(
     Example controller script.
     Navigates to the "Test Controller Buttons" menu and presses all buttons.
     """
-    if controller_state.get_controller() != Controller.PRO_CONTROLLER:
-        raise ValueError('This script only works with the Pro Controller!')
-
     # waits until controller is fully connected
     await controller_state.connect()
 
@@ -685,7 +555,7 @@ async def friend_remover(
 
     # Remove friends
     for i in range(num_friends):
-        print(str(i)+"/"+str(num_friends))
+        logger.info(f'{i}/{num_friends}')
         await button_push(controller_state, 'a')
         await asyncio.sleep(1.0)
         await button_push(controller_state, 'down')
@@ -708,11 +578,10 @@ async def set_nfc(controller_state, file_path):
     :param controller_state: Emulated controller state
     :param file_path: Path to nfc dump file
     """
-    loop = asyncio.get_event_loop()
-
-    with open(file_path, 'rb') as nfc_file:
-        content = await loop.run_in_executor(None, nfc_file.read)
-        controller_state.set_nfc(content)
+    # read in an executor, a slow disk (e.g. the SD card of a Raspberry Pi) must not stall the input reports
+    loop = asyncio.get_running_loop()
+    content = await loop.run_in_executor(None, Path(file_path).read_bytes)
+    controller_state.set_nfc(content)
 
 
 async def mash_button(controller_state, button, interval):
@@ -722,44 +591,92 @@ async def mash_button(controller_state, button, interval):
     if button not in controller_state.button_state.get_available_buttons():
         raise ValueError(f'Button {button} does not exist on {controller_state.get_controller()}')
 
+    interval = float(interval)
+
+    # only one stdin reader may exist at a time, otherwise it races with the reader of the cli
     user_input = asyncio.ensure_future(
         ainput(prompt=f'Pressing the {button} button every {interval} seconds... Press <enter> to stop.')
     )
-    # push a button repeatedly until user input
-    while not user_input.done():
-        await button_push(controller_state, button)
-        await asyncio.sleep(float(interval))
+    try:
+        # push a button repeatedly until user input
+        loop = asyncio.get_running_loop()
+        # schedule against a deadline so the time spent pushing does not add up
+        deadline = loop.time()
+        while not user_input.done():
+            await button_push(controller_state, button)
+            deadline += interval
+            # wakes up early if <enter> is pressed instead of sleeping the full interval
+            await asyncio.wait((user_input,), timeout=max(0.0, deadline - loop.time()))
+    finally:
+        # stop the reader if pushing failed, e.g. because the connection was lost
+        if user_input.cancel():
+            with suppress(asyncio.CancelledError):
+                await user_input
 
     # await future to trigger exceptions in case something went wrong
     await user_input
 
 
-async def _main(args):
+def _bind(script, controller_state: ControllerState) -> partial:
+    """
+    Binds a controller script to the controller state, so it can be registered as a cli command.
+    :param script: coroutine function taking the controller state as first argument
+    """
+    command = partial(script, controller_state)
+    # otherwise 'help' would print the doc string of partial itself
+    command.__doc__ = None
+    return command
+
+
+@dataclass(frozen=True)
+class CliConfig:
+    """
+    Parsed command line arguments
+    """
+    __slots__ = ('controller', 'device_id', 'spi_flash', 'reconnect_bt_addr', 'log', 'nfc')
+
+    controller: Controller
+    device_id: Optional[str]
+    spi_flash: Optional[str]
+    reconnect_bt_addr: Optional[str]
+    log: Optional[str]
+    nfc: Optional[str]
+
+    @staticmethod
+    def from_args(args: argparse.Namespace) -> 'CliConfig':
+        return CliConfig(controller=args.controller, device_id=args.device_id, spi_flash=args.spi_flash,
+                         reconnect_bt_addr=args.reconnect_bt_addr, log=args.log, nfc=args.nfc)
+
+
+async def _main(cfg: CliConfig):
     # parse the spi flash
-    if args.spi_flash:
-        with open(args.spi_flash, 'rb') as spi_flash_file:
+    if cfg.spi_flash:
+        with open(cfg.spi_flash, 'rb') as spi_flash_file:
             spi_flash = FlashMemory(spi_flash_file.read())
     else:
         # Create memory containing default controller stick calibration
         spi_flash = FlashMemory()
 
-    # Get controller name to emulate from arguments
-    controller = Controller.from_arg(args.controller)
+    # Controller to emulate, already converted by the argument parser
+    controller = cfg.controller
 
-    with utils.get_output(path=args.log, default=None) as capture_file:
+    with utils.get_output(path=cfg.log, default=None) as capture_file:
         factory = controller_protocol_factory(controller, spi_flash=spi_flash)
         ctl_psm, itr_psm = 17, 19
-        transport, protocol = await create_hid_server(factory, reconnect_bt_addr=args.reconnect_bt_addr,
+        transport, protocol = await create_hid_server(factory, reconnect_bt_addr=cfg.reconnect_bt_addr,
                                                       ctl_psm=ctl_psm,
                                                       itr_psm=itr_psm, capture_file=capture_file,
-                                                      device_id=args.device_id)
+                                                      device_id=cfg.device_id)
 
         controller_state = protocol.get_controller_state()
+        # the controller type cannot change at runtime
+        is_joycon_l = controller == Controller.JOYCON_L
 
         # Create command line interface and add some extra commands
         cli = ControllerCLI(controller_state)
 
         # Wrap the script so we can pass the controller state. The doc string will be printed when calling 'help'
+        # The scripts are only looked up when the command is run, not all of them are available in this module
         async def _run_test_control():
             """
             test_control - test method that will be removed later
@@ -813,10 +730,11 @@ async def _main(args):
             Usage:
                 mash <button> <interval>
             """
-            if not len(args) == 2:
+            try:
+                button, interval = args
+            except ValueError:
                 raise ValueError('"mash_button" command requires a button and interval as arguments!')
 
-            button, interval = args
             await mash_button(controller_state, button, interval)
 
         # Create nfc command
@@ -828,49 +746,60 @@ async def _main(args):
                 nfc <file_name>          Set controller state NFC content to file
                 nfc remove               Remove NFC content from controller state
             """
-            if controller_state.get_controller() == Controller.JOYCON_L:
+            if is_joycon_l:
                 raise ValueError('NFC content cannot be set for JOYCON_L')
-            elif not args:
+
+            try:
+                file_path, = args
+            except ValueError:
                 raise ValueError('"nfc" command requires file path to an nfc dump as argument!')
-            elif args[0] == 'remove':
+
+            if file_path == 'remove':
                 controller_state.set_nfc(None)
-                print('Removed nfc content.')
+                logger.info('Removed nfc content.')
             else:
-                await set_nfc(controller_state, args[0])
-
-        async def _run_auto_host():
-            await run_auto_host(controller_state)
-
-        async def _run_date_skipper():
-            await date_skipper(controller_state)
-
-        async def _run_friend_remover():
-            await friend_remover(controller_state)
-
-        cli.add_command('test_buttons', _run_test_controller_buttons)
-        cli.add_command('keyboard', _run_keyboard_control)
-        cli.add_command('recording', _run_recording_control)
-        cli.add_command('playback', _run_recording_playback)
-        cli.add_command('delete_rec', _run_delete_recording)
-        cli.add_command('mash', call_mash_button)
-        # add the script from above
-        cli.add_command('nfc', nfc)
-
-        cli.add_command('skip', _run_date_skipper)
-        cli.add_command('host', _run_auto_host)
-        cli.add_command('remove', _run_friend_remover)
-
-        if args.nfc is not None:
-            await nfc(args.nfc)
+                await set_nfc(controller_state, file_path)
+
+        _run_auto_host = _bind(run_auto_host, controller_state)
+        _run_date_skipper = _bind(date_skipper, controller_state)
+        _run_friend_remover = _bind(friend_remover, controller_state)
+
+        cli.add_commands({
+            'test_buttons': _run_test_controller_buttons,
+            'keyboard': _run_keyboard_control,
+            'recording': _run_recording_control,
+            'playback': _run_recording_playback,
+            'delete_rec': _run_delete_recording,
+            'mash': call_mash_button,
+            # add the script from above
+            'nfc': nfc
+        })
+
+        cli.add_commands({
+            'skip': _run_date_skipper,
+            'host': _run_auto_host,
+            'remove': _run_friend_remover
+        }, requires=Controller.PRO_CONTROLLER)
+
+        if cfg.nfc is not None:
+            await nfc(cfg.nfc)
+
+        # cancel on SIGINT/SIGTERM, so the transport is closed properly by the finally block below
+        loop = asyncio.get_running_loop()
+        main_task = asyncio.current_task()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, main_task.cancel)
 
         try:
             await cli.run()
+        except asyncio.CancelledError:
+            pass
         finally:
             logger.info('Stopping communication...')
             await transport.close()
 
 
-if __name__ == '__main__':
+def main():
     # check if root
     if not os.geteuid() == 0:
         raise PermissionError('Script must be run as root!')
@@ -880,16 +809,26 @@ if __name__ == '__main__':
     log.configure()
 
     parser = argparse.ArgumentParser()
-    parser.add_argument('controller', help='JOYCON_R, JOYCON_L or PRO_CONTROLLER')
+    parser.add_argument('controller', type=Controller.from_arg, help='JOYCON_R, JOYCON_L or PRO_CONTROLLER')
     parser.add_argument('-l', '--log')
     parser.add_argument('-d', '--device_id')
     parser.add_argument('--spi_flash')
     parser.add_argument('-r', '--reconnect_bt_addr', type=str, default=None,
                         help='The Switch console Bluetooth address, for reconnecting as an already paired controller')
     parser.add_argument('--nfc', type=str, default=None)
-    args = parser.parse_args()
+    cfg = CliConfig.from_args(parser.parse_args())
+
+    if uvloop is None:
+        asyncio.run(_main(cfg))
+    elif hasattr(asyncio, 'Runner'):
+        # libuv based event loop, lower overhead for the many small Bluetooth I/O callbacks
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            runner.run(_main(cfg))
+    else:
+        # asyncio.Runner requires Python 3.11
+        uvloop.install()
+        asyncio.run(_main(cfg))
 
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(
-        _main(args)
-    )
+
+if __name__ == '__main__':
+    main()
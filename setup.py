@@ -11,6 +11,10 @@ setup(name='joycontrol',
       zip_safe=False,
       install_requires=[
           'hid', 'aioconsole', 'dbus-python', 'crc8'
-      ]
+      ],
+      extras_require={
+          'uvloop': ['uvloop'],
+          'evdev': ['evdev']
+      }
       )
 